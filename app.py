@@ -1,15 +1,49 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, g, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from flask_caching import Cache
+from sqlalchemy import func, case, and_, cast, select, insert, update, event, bindparam, Integer
 from datetime import datetime, timedelta
 import os
+import orjson
+import time
+import threading
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 import csv
-import io
 from pathlib import Path
+from itertools import groupby
+from operator import attrgetter
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson for faster response encoding"""
+    def dumps(self, obj, **kwargs):
+        # Keep Flask's sorted-key output; fall back to Flask's default() for other types
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_SORT_KEYS | orjson.OPT_NAIVE_UTC).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
+# Logging - records are queued on the request thread and written by a
+# background listener so log calls never block on stream I/O
+log_queue = queue.Queue(-1)
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+log_listener = QueueListener(log_queue, log_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+logger = logging.getLogger('timestamp')
+logger.addHandler(QueueHandler(log_queue))
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+
 # Database configuration - uses PostgreSQL on Render, SQLite locally
 # Database configuration
 database_url = os.environ.get('DATABASE_URL', 'sqlite:///timestamp.db')
@@ -20,8 +54,37 @@ app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Connection pool sizing (PostgreSQL only)
+# Each Gunicorn worker holds its own pool, so the worst case is
+# workers x (pool_size + max_overflow) connections; keep that below the
+# server's max_connections by tuning DB_POOL_SIZE / DB_MAX_OVERFLOW.
+if database_url.startswith('postgresql://'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 20)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 40)),
+        'pool_pre_ping': True,
+        'pool_recycle': 300,
+        'connect_args': {'connect_timeout': 5}
+    }
+
 db = SQLAlchemy(app)
 
+# Short-lived response cache for dashboard polling
+# SimpleCache is per-process; set CACHE_TYPE=RedisCache (plus CACHE_REDIS_URL)
+# when running more than one Gunicorn worker so invalidation is shared.
+# Cached device stats may lag by up to DEVICES_CACHE_TIMEOUT seconds, which is
+# well inside the dashboard's 5s refresh and the 120s staleness window.
+DEVICES_CACHE_TIMEOUT = 5
+cache = Cache(app, config={
+    'CACHE_TYPE': os.environ.get('CACHE_TYPE', 'SimpleCache'),
+    'CACHE_REDIS_URL': os.environ.get('CACHE_REDIS_URL'),
+    'CACHE_DEFAULT_TIMEOUT': DEVICES_CACHE_TIMEOUT
+})
+
+def format_datetime(dt):
+    """Format a datetime as YYYY-MM-DD HH:MM:SS without going through strftime"""
+    return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d} {dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}"
+
 # Session model
 class Session(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -34,57 +97,197 @@ class Session(db.Model):
     status = db.Column(db.String(20), default='active')  # 'active' or 'completed'
     device_session_id = db.Column(db.Integer, default=1)
 
+    # Composite indexes for the device/date, device/status and stale-check filters.
+    # db.create_all() only creates these on new tables; existing deployments need
+    # e.g. CREATE INDEX CONCURRENTLY ix_session_device_date ON session (device_id, date);
+    __table_args__ = (
+        db.Index('ix_session_device_date', 'device_id', 'date'),
+        db.Index('ix_session_device_status', 'device_id', 'status'),
+        db.Index('ix_session_status_hb', 'status', 'last_heartbeat'),
+    )
+
     def to_dict(self):
-        return {
-            'id': self.id,
-            'session_number': self.device_session_id,
-            'device_id': self.device_id,
-            'session_start': self.session_start.strftime('%Y-%m-%d %H:%M:%S'),
-            'last_heartbeat': self.last_heartbeat.strftime('%Y-%m-%d %H:%M:%S'),
-            'session_end': self.session_end.strftime('%Y-%m-%d %H:%M:%S') if self.session_end else None,
-            'runtime_seconds': self.runtime_seconds,
-            'runtime_formatted': self.format_runtime(),
-            'date': self.date,
-            'status': self.status
-        }
+        return session_to_dict(self)
     
     def format_runtime(self):
         """Format runtime in human-readable format"""
-        hours = self.runtime_seconds // 3600
-        minutes = (self.runtime_seconds % 3600) // 60
-        seconds = self.runtime_seconds % 60
-        
-        if hours > 0:
-            return f"{hours}h {minutes}m"
-        elif minutes > 0:
-            return f"{minutes}m {seconds}s"
-        else:
-            return f"{seconds}s"
+        return format_runtime(self.runtime_seconds)
+
+def session_to_dict(session):
+    """Serialize a Session, or a row with the same columns, for API responses"""
+    return {
+        'id': session.id,
+        'session_number': session.device_session_id,
+        'device_id': session.device_id,
+        'session_start': format_datetime(session.session_start),
+        'last_heartbeat': format_datetime(session.last_heartbeat),
+        'session_end': format_datetime(session.session_end) if session.session_end else None,
+        'runtime_seconds': session.runtime_seconds,
+        'runtime_formatted': format_runtime(session.runtime_seconds),
+        'date': session.date,
+        'status': session.status
+    }
+
+def format_runtime(runtime_seconds):
+    """Format a runtime in seconds in human-readable format"""
+    hours = runtime_seconds // 3600
+    minutes = (runtime_seconds % 3600) // 60
+    seconds = runtime_seconds % 60
+    
+    if hours > 0:
+        return f"{hours}h {minutes}m"
+    elif minutes > 0:
+        return f"{minutes}m {seconds}s"
+    else:
+        return f"{seconds}s"
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL and a busy timeout so concurrent writers wait instead of failing"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA busy_timeout=5000')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.close()
 
 # Create tables
 with app.app_context():
+    if database_url.startswith('sqlite'):
+        event.listen(db.engine, 'connect', set_sqlite_pragmas)
     db.create_all()
 
+def elapsed_seconds(end, start):
+    """SQL expression for the whole seconds between two datetimes"""
+    if database_url.startswith('sqlite'):
+        # SQLite has no interval type; julianday() returns fractional days
+        return cast(func.round((func.julianday(end) - func.julianday(start)) * 86400, 3), Integer)
+    return cast(func.floor(func.extract('epoch', end - start)), Integer)
+
+# Stale checks run at most once per interval across request threads; the
+# interval stays well below the 120s staleness threshold.
+STALE_CHECK_INTERVAL = 30
+_last_stale_check = 0.0
+_stale_check_lock = threading.Lock()
+
 def check_stale_sessions():
     """Mark sessions as completed if no heartbeat for 120 seconds"""
-    threshold = datetime.utcnow() - timedelta(seconds=120)
-    stale_sessions = Session.query.filter(
-        Session.status == 'active',
-        Session.last_heartbeat < threshold
-    ).all()
+    global _last_stale_check
+    
+    check_time = time.monotonic()
+    if check_time - _last_stale_check < STALE_CHECK_INTERVAL:
+        return
+    with _stale_check_lock:
+        if check_time - _last_stale_check < STALE_CHECK_INTERVAL:
+            return
+        _last_stale_check = check_time
+    
+    now = datetime.utcnow()
+    threshold = now - timedelta(seconds=120)
+    
+    # Close every stale session in a single UPDATE ... RETURNING
+    stale_sessions = db.session.execute(
+        update(Session).where(
+            Session.status == 'active',
+            Session.last_heartbeat < threshold
+        ).values(
+            status='completed',
+            session_end=Session.last_heartbeat,
+            runtime_seconds=elapsed_seconds(Session.last_heartbeat, Session.session_start)
+        ).returning(Session)
+    ).scalars().all()
     
     for session in stale_sessions:
-        missed_seconds = int((datetime.utcnow() - session.last_heartbeat).total_seconds())
-        print(f"DEBUG: Marking session {session.id} ({session.device_id}) as stale. Last heartbeat was {missed_seconds}s ago.")
-        
-        session.status = 'completed'
-        session.session_end = session.last_heartbeat
-        session.runtime_seconds = int((session.session_end - session.session_start).total_seconds())
-        log_session_to_csv(session)
+        missed_seconds = int((now - session.last_heartbeat).total_seconds())
+        logger.debug("Marking session %s (%s) as stale. Last heartbeat was %ss ago.", session.id, session.device_id, missed_seconds)
     
     if stale_sessions:
+        log_sessions_batch(stale_sessions)
         db.session.commit()
 
+# Heartbeats are coalesced in memory and flushed in one transaction every
+# HEARTBEAT_FLUSH_INTERVAL seconds. A lost batch (e.g. on crash) is covered
+# by the 120s staleness threshold.
+HEARTBEAT_FLUSH_INTERVAL = 0.5
+heartbeat_queue = {}  # session id -> latest heartbeat time
+heartbeat_lock = threading.Lock()
+
+def flush_heartbeats():
+    """Write all queued heartbeats to the database in a single transaction"""
+    global heartbeat_queue
+    
+    with heartbeat_lock:
+        if not heartbeat_queue:
+            return
+        pending, heartbeat_queue = heartbeat_queue, {}
+    
+    stmt = update(Session.__table__).where(
+        Session.__table__.c.id == bindparam('b_id'),
+        Session.__table__.c.status == 'active'
+    ).values(last_heartbeat=bindparam('b_heartbeat'))
+    
+    try:
+        with app.app_context():
+            with db.engine.begin() as conn:
+                conn.execute(stmt, [
+                    {'b_id': session_id, 'b_heartbeat': heartbeat}
+                    for session_id, heartbeat in pending.items()
+                ])
+    except Exception as e:
+        logger.error("Failed to flush heartbeats: %s", e)
+        # Requeue unless a newer heartbeat arrived in the meantime
+        with heartbeat_lock:
+            for session_id, heartbeat in pending.items():
+                heartbeat_queue.setdefault(session_id, heartbeat)
+
+# Clients are told when to send their next heartbeat. The interval grows with
+# the number of active sessions to keep the heartbeat rate near
+# HEARTBEAT_TARGET_RATE per second, capped well below the 120s staleness threshold.
+HEARTBEAT_MIN_INTERVAL = 10
+HEARTBEAT_MAX_INTERVAL = 60
+HEARTBEAT_TARGET_RATE = 200
+ACTIVE_COUNT_REFRESH_INTERVAL = 30
+active_session_count = 0
+
+def refresh_active_session_count():
+    """Cache the number of active sessions for heartbeat interval decisions"""
+    global active_session_count
+    
+    try:
+        with app.app_context():
+            active_session_count = db.session.query(func.count(Session.id)).filter(
+                Session.status == 'active'
+            ).scalar()
+    except Exception as e:
+        logger.error("Failed to count active sessions: %s", e)
+
+def next_heartbeat_interval():
+    """Seconds a client should wait before its next heartbeat"""
+    return max(HEARTBEAT_MIN_INTERVAL, min(HEARTBEAT_MAX_INTERVAL, active_session_count // HEARTBEAT_TARGET_RATE))
+
+def run_heartbeat_flusher():
+    """Background loop that periodically flushes queued heartbeats"""
+    last_count_refresh = 0.0
+    while True:
+        time.sleep(HEARTBEAT_FLUSH_INTERVAL)
+        flush_heartbeats()
+        
+        if time.monotonic() - last_count_refresh >= ACTIVE_COUNT_REFRESH_INTERVAL:
+            refresh_active_session_count()
+            last_count_refresh = time.monotonic()
+
+threading.Thread(target=run_heartbeat_flusher, name='heartbeat-flusher', daemon=True).start()
+atexit.register(flush_heartbeats)
+
+def invalidate_devices_cache():
+    """Drop the cached /api/devices response after a session starts or stops"""
+    cache.delete('view//api/devices')
+
+@app.before_request
+def set_request_time():
+    """Compute the current UTC time and date once per request"""
+    g.now_utc = datetime.utcnow()
+    g.today = g.now_utc.date().isoformat()
+
 @app.after_request
 def add_header(response):
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0'
@@ -94,30 +297,70 @@ def add_header(response):
 
 def log_session_to_csv(session):
     """Log session details to a daily CSV file"""
+    log_sessions_batch([session])
+
+def log_sessions_batch(sessions):
+    """Log several sessions, opening each daily CSV file only once"""
     try:
         log_dir = Path('logs')
         log_dir.mkdir(exist_ok=True)
         
-        file_path = log_dir / f"sessions_{session.date}.csv"
-        file_exists = file_path.exists()
+        # Group sessions by date so each daily file is written in one pass
+        sessions_by_date = {}
+        for session in sessions:
+            sessions_by_date.setdefault(session.date, []).append(session)
         
-        with open(file_path, mode='a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            if not file_exists:
-                writer.writerow(['Date', 'Device ID', 'Session ID', 'Start Time', 'End Time', 'Runtime', 'Status'])
+        for date, date_sessions in sessions_by_date.items():
+            file_path = log_dir / f"sessions_{date}.csv"
+            file_exists = file_path.exists()
             
-            writer.writerow([
-                session.date,
-                session.device_id,
-                f"#{session.device_session_id}",
-                session.session_start.strftime('%H:%M:%S'),
-                session.session_end.strftime('%H:%M:%S') if session.session_end else 'N/A',
-                session.format_runtime(),
-                session.status
-            ])
-        print(f"DEBUG: Logged session {session.id} to {file_path}")
+            with open(file_path, mode='a', newline='', encoding='utf-8', buffering=1 << 16) as f:
+                writer = csv.writer(f)
+                if not file_exists:
+                    writer.writerow(['Date', 'Device ID', 'Session ID', 'Start Time', 'End Time', 'Runtime', 'Status'])
+                
+                writer.writerows([
+                    [
+                        session.date,
+                        session.device_id,
+                        f"#{session.device_session_id}",
+                        session.session_start.strftime('%H:%M:%S'),
+                        session.session_end.strftime('%H:%M:%S') if session.session_end else 'N/A',
+                        format_runtime(session.runtime_seconds),
+                        session.status
+                    ]
+                    for session in date_sessions
+                ])
+            logger.debug("Logged %d session(s) to %s", len(date_sessions), file_path)
     except Exception as e:
-        print(f"ERROR: Failed to log session to CSV: {str(e)}")
+        logger.error("Failed to log session to CSV: %s", e)
+
+def get_daily_runtime_totals(device_id, start_date=None, end_date=None):
+    """Total runtime per date (YYYY-MM-DD) for a device, including active sessions"""
+    filters = [Session.device_id == device_id]
+    if start_date and end_date:
+        # Dates are stored as YYYY-MM-DD strings, so the range compares strings
+        filters.append(Session.date.between(start_date, end_date))
+    
+    # Completed sessions contribute their stored runtime, active sessions
+    # their elapsed time so far - both summed per date in one query
+    daily_totals = dict(db.session.query(
+        Session.date,
+        func.sum(case(
+            (Session.status == 'active', elapsed_seconds(g.now_utc, Session.session_start)),
+            else_=Session.runtime_seconds
+        ))
+    ).filter(
+        *filters,
+        Session.status.in_(['completed', 'active'])
+    ).group_by(Session.date).all())
+    
+    return daily_totals
+
+class Echo:
+    """File-like object that returns written data, for streaming csv.writer rows"""
+    def write(self, value):
+        return value
 
 @app.route('/')
 def index():
@@ -136,41 +379,50 @@ def start_session():
         data = request.json
         device_id = data.get('device_id', 'unknown')
         
-        now = datetime.utcnow()
-        today = now.strftime('%Y-%m-%d')
+        now = g.now_utc
+        today = g.today
         
+        # Everything below runs in one transaction with a single commit
         # Close any existing active sessions for this device
-        existing_active = Session.query.filter(
-            Session.device_id == device_id,
-            Session.status == 'active'
-        ).all()
-        
-        for session in existing_active:
-            session.status = 'completed'
-            session.session_end = session.last_heartbeat
-            session.runtime_seconds = int((session.session_end - session.session_start).total_seconds())
+        db.session.execute(
+            update(Session).where(
+                Session.device_id == device_id,
+                Session.status == 'active'
+            ).values(
+                status='completed',
+                session_end=Session.last_heartbeat,
+                runtime_seconds=elapsed_seconds(Session.last_heartbeat, Session.session_start)
+            ),
+            execution_options={'synchronize_session': False}
+        )
         
         # Calculate next session ID for this device for TODAY
-        last_session_today = Session.query.filter_by(device_id=device_id, date=today).order_by(Session.device_session_id.desc()).first()
-        next_session_id = (last_session_today.device_session_id + 1) if last_session_today and last_session_today.device_session_id else 1
+        next_session_id = db.session.execute(
+            select(func.coalesce(func.max(Session.device_session_id) + 1, 1)).where(
+                Session.device_id == device_id,
+                Session.date == today
+            )
+        ).scalar()
 
         # Create new session
-        new_session = Session(
-            device_id=device_id,
-            device_session_id=next_session_id,
-            session_start=now,
-            last_heartbeat=now,
-            date=today,
-            status='active'
-        )
-        db.session.add(new_session)
+        new_session = db.session.execute(
+            insert(Session).values(
+                device_id=device_id,
+                device_session_id=next_session_id,
+                session_start=now,
+                last_heartbeat=now,
+                date=today,
+                status='active'
+            ).returning(*Session.__table__.c)
+        ).first()
         db.session.commit()
+        invalidate_devices_cache()
         
         return jsonify({
             'success': True,
             'message': 'Session started',
             'session_id': new_session.id,
-            'data': new_session.to_dict()
+            'data': session_to_dict(new_session)
         }), 201
     
     except Exception as e:
@@ -187,20 +439,22 @@ def heartbeat():
         if not session_id:
             return jsonify({'error': 'session_id required'}), 400
         
-        session = Session.query.get(session_id)
-        if not session:
-            return jsonify({'error': 'Session not found'}), 404
+        try:
+            session_id = int(session_id)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'session_id must be an integer'}), 400
         
-        session.last_heartbeat = datetime.utcnow()
-        db.session.commit()
+        # Written to the database by the background heartbeat flusher
+        with heartbeat_lock:
+            heartbeat_queue[session_id] = g.now_utc
         
         return jsonify({
             'success': True,
-            'message': 'Heartbeat updated'
+            'message': 'Heartbeat queued',
+            'next_after': next_heartbeat_interval()
         })
     
     except Exception as e:
-        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/session/stop', methods=['POST'])
@@ -213,22 +467,29 @@ def stop_session():
         if not session_id:
             return jsonify({'error': 'session_id required'}), 400
         
-        session = Session.query.get(session_id)
+        # Close the session and read back its columns in one round trip
+        now = g.now_utc
+        session = db.session.execute(
+            update(Session).where(Session.id == session_id).values(
+                session_end=now,
+                status='completed',
+                runtime_seconds=elapsed_seconds(now, Session.session_start)
+            ).returning(*Session.__table__.c),
+            execution_options={'synchronize_session': False}
+        ).first()
         if not session:
+            db.session.rollback()
             return jsonify({'error': 'Session not found'}), 404
         
-        now = datetime.utcnow()
-        session.session_end = now
-        session.status = 'completed'
-        session.runtime_seconds = int((now - session.session_start).total_seconds())
         db.session.commit()
+        invalidate_devices_cache()
         
         log_session_to_csv(session)
         
         return jsonify({
             'success': True,
             'message': 'Session stopped',
-            'data': session.to_dict()
+            'data': session_to_dict(session)
         })
     
     except Exception as e:
@@ -236,46 +497,50 @@ def stop_session():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/devices', methods=['GET'])
+@cache.cached(timeout=DEVICES_CACHE_TIMEOUT, response_filter=lambda rv: not isinstance(rv, tuple))
 def get_devices():
     """Get all devices with today's stats"""
     try:
         check_stale_sessions()  # Check for stale sessions first
         
-        today = datetime.utcnow().strftime('%Y-%m-%d')
+        today = g.today
+        
+        # Aggregate today's stats for every device in a single query
+        device_stats = db.session.query(
+            Session.device_id,
+            func.sum(case(
+                (and_(Session.status == 'completed', Session.date == today), Session.runtime_seconds),
+                else_=0
+            )).label('runtime_today'),
+            func.count(case((Session.date == today, 1))).label('session_count_today'),
+            func.max(Session.last_heartbeat).label('last_heartbeat')
+        ).group_by(Session.device_id).all()
+        
+        # Active sessions keyed by device, with elapsed runtime computed in SQL
+        active_sessions = {
+            device_id: (last_heartbeat, current_runtime)
+            for device_id, last_heartbeat, current_runtime in db.session.query(
+                Session.device_id,
+                Session.last_heartbeat,
+                elapsed_seconds(g.now_utc, Session.session_start)
+            ).filter(Session.status == 'active').all()
+        }
         
-        # Get all unique devices
-        devices = db.session.query(Session.device_id).distinct().all()
         device_list = []
         
-        for (device_id,) in devices:
-            # Get today's sessions for this device
-            today_sessions = Session.query.filter(
-                Session.device_id == device_id,
-                Session.date == today
-            ).all()
-            
+        for device_id, runtime_today, session_count_today, last_heartbeat in device_stats:
             # Calculate total runtime for today
-            total_runtime = sum(s.runtime_seconds for s in today_sessions if s.status == 'completed')
-            
-            # Check if any active session
-            active_session = Session.query.filter(
-                Session.device_id == device_id,
-                Session.status == 'active'
-            ).first()
+            total_runtime = int(runtime_today or 0)
             
             # If active session exists, add current runtime
+            active_session = active_sessions.get(device_id)
             if active_session:
-                current_runtime = int((datetime.utcnow() - active_session.session_start).total_seconds())
+                last_active, current_runtime = active_session
                 total_runtime += current_runtime
                 status = 'running'
-                last_active = active_session.last_heartbeat
             else:
                 status = 'stopped'
-                # Get last session
-                last_session = Session.query.filter(
-                    Session.device_id == device_id
-                ).order_by(Session.last_heartbeat.desc()).first()
-                last_active = last_session.last_heartbeat if last_session else None
+                last_active = last_heartbeat
             
             # Format runtime
             hours = total_runtime // 3600
@@ -292,8 +557,8 @@ def get_devices():
                 'status': status,
                 'today_runtime_seconds': total_runtime,
                 'today_runtime_formatted': runtime_formatted,
-                'session_count_today': len(today_sessions),
-                'last_active': last_active.strftime('%Y-%m-%d %H:%M:%S') if last_active else None
+                'session_count_today': session_count_today,
+                'last_active': format_datetime(last_active) if last_active else None
             })
         
         # Sort by status (running first) then by device_id
@@ -308,26 +573,40 @@ def get_devices():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+SESSIONS_PAGE_SIZE = 100
+SESSIONS_MAX_PAGE_SIZE = 500
+
 @app.route('/api/device/<device_id>/sessions', methods=['GET'])
 def get_device_sessions(device_id):
-    """Get all sessions for a device"""
+    """Get sessions for a device, newest first, one page at a time"""
     try:
         check_stale_sessions()
         
         date = request.args.get('date')  # Optional date filter (YYYY-MM-DD)
+        before = request.args.get('before')  # Optional cursor: next_cursor from the previous page
+        
+        try:
+            limit = max(1, min(int(request.args.get('limit', SESSIONS_PAGE_SIZE)), SESSIONS_MAX_PAGE_SIZE))
+            before = datetime.fromisoformat(before) if before else None
+        except ValueError:
+            return jsonify({'error': 'Invalid limit or before parameter'}), 400
         
         query = Session.query.filter(Session.device_id == device_id)
         
         if date:
             query = query.filter(Session.date == date)
+        if before:
+            query = query.filter(Session.session_start < before)
         
-        sessions = query.order_by(Session.session_start.desc()).all()
+        sessions = query.order_by(Session.session_start.desc()).limit(limit).all()
+        next_cursor = sessions[-1].session_start.isoformat() if len(sessions) == limit else None
         
         return jsonify({
             'success': True,
             'device_id': device_id,
             'sessions': [s.to_dict() for s in sessions],
-            'count': len(sessions)
+            'count': len(sessions),
+            'next_cursor': next_cursor
         })
     
     except Exception as e:
@@ -349,7 +628,7 @@ def get_daily_summary(device_id, date):
         # If there's an active session today, add current runtime
         active_session = next((s for s in sessions if s.status == 'active'), None)
         if active_session:
-            current_runtime = int((datetime.utcnow() - active_session.session_start).total_seconds())
+            current_runtime = int((g.now_utc - active_session.session_start).total_seconds())
             total_runtime += current_runtime
         
         hours = total_runtime // 3600
@@ -384,39 +663,21 @@ def get_device_history(device_id):
             end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
         else:
             # Default: Since 2026-01-01
-            end_date = datetime.utcnow()
+            end_date = g.now_utc
             start_date = datetime(2026, 1, 1)
         
-        print(f"DEBUG: Fetching history for {device_id} starting from {start_date}")
+        logger.debug("Fetching history for %s starting from %s", device_id, start_date)
         
-        # Get all sessions for this device in date range
-        # Note: end_date comparison needs to handle time, so we convert dates to strings for comparison
-        sessions = Session.query.filter(
-            Session.device_id == device_id,
-            Session.date >= start_date.strftime('%Y-%m-%d'),
-            Session.date <= end_date.strftime('%Y-%m-%d')
-        ).all()
+        start_str = start_date.strftime('%Y-%m-%d')
+        end_str = end_date.strftime('%Y-%m-%d')
         
-        # Group by date and calculate total runtime
-        daily_data = {}
-        for session in sessions:
-            date = session.date
-            if date not in daily_data:
-                daily_data[date] = 0
-            
-            if session.status == 'completed':
-                daily_data[date] += session.runtime_seconds
-            elif session.status == 'active':
-                # Add current runtime for active sessions
-                current_runtime = int((datetime.utcnow() - session.session_start).total_seconds())
-                daily_data[date] += current_runtime
+        daily_data = get_daily_runtime_totals(device_id, start_str, end_str)
         
         # Create list of all dates in range (fill missing dates with 0)
         history = []
-        current_date = start_date
-        while current_date <= end_date:
-            date_str = current_date.strftime('%Y-%m-%d')
-            runtime_seconds = daily_data.get(date_str, 0)
+        for ordinal in range(start_date.toordinal(), end_date.toordinal() + 1):
+            date_str = datetime.fromordinal(ordinal).date().isoformat()
+            runtime_seconds = int(daily_data.get(date_str, 0))
             runtime_hours = round(runtime_seconds / 3600, 2)  # Convert to hours
             
             history.append({
@@ -424,7 +685,6 @@ def get_device_history(device_id):
                 'runtime_seconds': runtime_seconds,
                 'runtime_hours': runtime_hours
             })
-            current_date += timedelta(days=1)
         
         return jsonify({
             'success': True,
@@ -439,50 +699,44 @@ def get_device_history(device_id):
 def export_device_csv(device_id):
     """Export all session data for a device as CSV"""
     try:
-        # Get all sessions for this device
-        sessions = Session.query.filter_by(device_id=device_id).order_by(Session.date.desc(), Session.session_start.desc()).all()
-        
-        # Group by date to calculate day totals
-        daily_totals = {}
-        for s in sessions:
-            if s.date not in daily_totals:
-                daily_totals[s.date] = 0
-            
+        sessions = Session.query.filter_by(device_id=device_id).order_by(Session.date.desc(), Session.session_start.desc())
+        now = g.now_utc
+        
+        def day_runtime(s):
             if s.status == 'completed':
-                daily_totals[s.date] += s.runtime_seconds
+                return s.runtime_seconds
             elif s.status == 'active':
-                current_runtime = int((datetime.utcnow() - s.session_start).total_seconds())
-                daily_totals[s.date] += current_runtime
+                return int((now - s.session_start).total_seconds())
+            return 0
         
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Headers
-        writer.writerow(['Date', 'Session ID', 'Start Time', 'End Time', 'Runtime', 'Status', 'Day Total (HH:MM)'])
-        
-        for s in sessions:
-            # Format Day Total only once per date
-            dt_seconds = daily_totals.get(s.date, 0)
-            dt_hours = dt_seconds // 3600
-            dt_minutes = (dt_seconds % 3600) // 60
-            day_total_str = f"{dt_hours}h {dt_minutes}m"
+        def generate():
+            writer = csv.writer(Echo())
             
-            writer.writerow([
-                s.date,
-                f"#{s.device_session_id}",
-                s.session_start.strftime('%H:%M:%S'),
-                s.session_end.strftime('%H:%M:%S') if s.session_end else 'Active',
-                s.format_runtime() if hasattr(s, 'format_runtime') else 'N/A',
-                s.status.capitalize(),
-                day_total_str
-            ])
-        
-        output.seek(0)
-        from flask import make_response
-        res = make_response(output.getvalue())
-        res.headers["Content-Disposition"] = f"attachment; filename={device_id}_history.csv"
-        res.headers["Content-type"] = "text/csv"
-        return res
+            # Headers
+            yield writer.writerow(['Date', 'Session ID', 'Start Time', 'End Time', 'Runtime', 'Status', 'Day Total (HH:MM)'])
+            
+            # Rows are ordered by date, so each day is buffered once to compute its total
+            for date, group in groupby(sessions.yield_per(500), key=attrgetter('date')):
+                day_sessions = list(group)
+                dt_seconds = sum(day_runtime(s) for s in day_sessions)
+                day_total_str = f"{dt_seconds // 3600}h {(dt_seconds % 3600) // 60}m"
+                
+                yield ''.join([
+                    writer.writerow([
+                        s.date,
+                        f"#{s.device_session_id}",
+                        s.session_start.strftime('%H:%M:%S'),
+                        s.session_end.strftime('%H:%M:%S') if s.session_end else 'Active',
+                        s.format_runtime() if hasattr(s, 'format_runtime') else 'N/A',
+                        s.status.capitalize(),
+                        day_total_str
+                    ])
+                    for s in day_sessions
+                ])
+        
+        return Response(stream_with_context(generate()), mimetype='text/csv', headers={
+            'Content-Disposition': f"attachment; filename={device_id}_history.csv"
+        })
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500